@@ -2,19 +2,20 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from typing import Dict, List, Union, Optional
+from typing import Dict, List, Union, Optional, Tuple
 from starlette.requests import Request
 from datetime import datetime
 import uvicorn, json, uuid
 from pydantic import ValidationError
 from .schemas import Message, MessageBroadcast, ReactionRequest, MessageRequest, ReactionData, AddReactionRequest, RemoveReactionRequest
+from .schemas import DirectMessageRequest, TypingRequest, ReadReceiptRequest
 
 
 from fastapi import UploadFile, File, Form
 import os, shutil
 
 
-from .auth import router as auth_router, verify_token
+from .auth import router as auth_router, verify_token, fake_users_db
 
 app = FastAPI()
 app.include_router(auth_router)
@@ -28,19 +29,25 @@ async def health():
     return {"status": "ok"}
 
 
+def authenticated_user(request: Request) -> Optional[str]:
+    """Return the username from the request's Bearer token, or None if missing or invalid."""
+    auth = request.headers.get('authorization')
+    if not auth or not auth.lower().startswith('bearer '):
+        return None
+    token = auth.split(None, 1)[1]
+    try:
+        return verify_token(token)
+    except Exception:
+        return None
+
+
 @app.post("/upload")
 async def upload_file(request: Request, file: UploadFile = File(...), view_once: bool = Form(False)):
     """Save uploaded file and optionally create a view-once token.
     If `view_once` is True a token URL `/view/{token}` is returned; otherwise a static `/uploads/{filename}` URL is returned.
     """
     # Verify Authorization header (expect Bearer token)
-    auth = request.headers.get('authorization')
-    if not auth or not auth.lower().startswith('bearer '):
-        return HTMLResponse(status_code=401, content="Unauthorized")
-    token = auth.split(None, 1)[1]
-    try:
-        verify_token(token)
-    except Exception:
+    if authenticated_user(request) is None:
         return HTMLResponse(status_code=401, content="Unauthorized")
 
     # Save uploaded file to uploads dir (use absolute path to avoid relative-path issues)
@@ -127,6 +134,10 @@ class ConnectionManager:
         self.rooms: Dict[str, List[WebSocket]] = {}
         self.users: Dict[str, Dict[str, str]] = {}   # room  {ws_id: username}
         self.messages: Dict[str, Dict[str, Message]] = {}  # room  {message_id: Message}
+        # username  {ws_id: (room, websocket)} for targeted delivery across devices
+        self.user_connections: Dict[str, Dict[int, Tuple[str, WebSocket]]] = {}
+        # (user_a, user_b) sorted  {message_id: Message}
+        self.direct_messages: Dict[Tuple[str, str], Dict[str, Message]] = {}
         # map view tokens to file paths for view-once media
         self.view_tokens: Dict[str, str] = {}
 
@@ -134,6 +145,7 @@ class ConnectionManager:
         await websocket.accept()
         self.rooms.setdefault(room, []).append(websocket)
         self.users.setdefault(room, {})[id(websocket)] = username
+        self.user_connections.setdefault(username, {})[id(websocket)] = (room, websocket)
         await self.broadcast(room, {"type": "join", "user": username, "online": list(self.users[room].values())})
 
     async def disconnect(self, room: str, websocket: WebSocket):
@@ -141,12 +153,44 @@ class ConnectionManager:
             self.rooms[room].remove(websocket)
             if room in self.users and id(websocket) in self.users[room]:
                 username = self.users[room].pop(id(websocket))
+                self._drop_user_connection(username, websocket)
                 await self.broadcast(room, {"type": "leave", "user": username, "online": list(self.users[room].values())})
             if not self.rooms[room]:
                 del self.rooms[room]
                 if room in self.users:
                     del self.users[room]
 
+    def _drop_user_connection(self, username: str, websocket: WebSocket) -> None:
+        """Remove a socket from the username index"""
+        connections = self.user_connections.get(username)
+        if connections is not None:
+            connections.pop(id(websocket), None)
+            if not connections:
+                del self.user_connections[username]
+
+    @staticmethod
+    def conversation_key(user_a: str, user_b: str) -> Tuple[str, str]:
+        """Order-independent key for a direct conversation between two users"""
+        return (user_a, user_b) if user_a <= user_b else (user_b, user_a)
+
+    def store_direct_message(self, message: Message) -> None:
+        """Store a direct message in the conversation history"""
+        key = self.conversation_key(message.user, message.to)
+        self.direct_messages.setdefault(key, {})[message.id] = message
+
+    def get_direct_message(self, user_a: str, user_b: str, message_id: str) -> Optional[Message]:
+        """Get a specific direct message by ID"""
+        return self.direct_messages.get(self.conversation_key(user_a, user_b), {}).get(message_id)
+
+    def get_direct_history(self, user_a: str, user_b: str) -> List[Message]:
+        """Get the direct message history between two users, oldest first"""
+        return list(self.direct_messages.get(self.conversation_key(user_a, user_b), {}).values())
+
+    def verify_read_receipt(self, reader: str, sender: str, message_id: str) -> bool:
+        """Verify that `sender` sent the direct message `message_id` to `reader`"""
+        message = self.get_direct_message(reader, sender, message_id)
+        return message is not None and message.user == sender and message.to == reader
+
     def store_message(self, room: str, message: Message) -> None:
         """Store a message in the room''s message history"""
         self.messages.setdefault(room, {})[message.id] = message
@@ -190,22 +234,48 @@ class ConnectionManager:
         
         return False
 
+    @staticmethod
+    def serialize(message: Union[dict, MessageBroadcast]) -> str:
+        """Serialize an outgoing frame to JSON text"""
+        # Convert to dict if it''s a Pydantic model
+        if isinstance(message, MessageBroadcast):
+            message_data = message.model_dump(exclude_none=True)
+            # Convert datetime to ISO string for JSON serialization
+            if "timestamp" in message_data and message_data["timestamp"]:
+                message_data["timestamp"] = message_data["timestamp"].isoformat()
+            # Convert reactions to dict format
+            if "reactions" in message_data and message_data["reactions"]:
+                message_data["reactions"] = message_data["reactions"]["emoji"]
+        else:
+            message_data = message
+        return json.dumps(message_data)
+
+    async def send_to_user(self, username: str, message: Union[dict, MessageBroadcast]) -> bool:
+        """Send a message to every connection of a single user. Returns True if delivered to at least one."""
+        connections = self.user_connections.get(username)
+        if not connections:
+            return False
+
+        message_text = self.serialize(message)
+        delivered = False
+        disconnected = []
+        # Copy since disconnect cleanup mutates the index
+        for room, websocket in list(connections.values()):
+            try:
+                await websocket.send_text(message_text)
+                delivered = True
+            except:
+                disconnected.append((room, websocket))
+
+        # Clean up disconnected websockets
+        for room, websocket in disconnected:
+            await self.disconnect(room, websocket)
+        return delivered
+
     async def broadcast(self, room: str, message: Union[dict, MessageBroadcast]):
         """Broadcast a message to all clients in a room"""
         if room in self.rooms:
-            # Convert to dict if it''s a Pydantic model
-            if isinstance(message, MessageBroadcast):
-                message_data = message.model_dump(exclude_none=True)
-                # Convert datetime to ISO string for JSON serialization
-                if "timestamp" in message_data and message_data["timestamp"]:
-                    message_data["timestamp"] = message_data["timestamp"].isoformat()
-                # Convert reactions to dict format
-                if "reactions" in message_data and message_data["reactions"]:
-                    message_data["reactions"] = message_data["reactions"]["emoji"]
-            else:
-                message_data = message
-            
-            message_text = json.dumps(message_data)
+            message_text = self.serialize(message)
             disconnected = []
             for websocket in self.rooms[room]:
                 try:
@@ -228,6 +298,20 @@ async def get_index(request: Request):
 async def get_login(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
+
+@app.get("/dm/{peer}")
+async def direct_history(request: Request, peer: str):
+    """Return the direct message history between the authenticated user and `peer`, oldest first."""
+    # Verify Authorization header (expect Bearer token)
+    username = authenticated_user(request)
+    if username is None:
+        return HTMLResponse(status_code=401, content="Unauthorized")
+    if peer not in fake_users_db:
+        return HTMLResponse(status_code=404, content="Not found")
+
+    history = manager.get_direct_history(username, peer)
+    return {"messages": [message.model_dump(mode="json", exclude_none=True) for message in history]}
+
 @app.websocket("/ws/{room}/{username}")
 async def websocket_endpoint(websocket: WebSocket, room: str, username: str):
     # Extract token from query params and verify
@@ -293,6 +377,59 @@ async def websocket_endpoint(websocket: WebSocket, room: str, username: str):
                                 emoji=request.emoji,
                                 users=users
                             ))
+                elif data["type"] == "direct_message":
+                    request = DirectMessageRequest(**data)
+                    if request.to not in fake_users_db:
+                        await websocket.send_json({"type": "error", "detail": "Unknown recipient", "to": request.to})
+                        continue
+                    message = Message(
+                        id=str(uuid.uuid4()),
+                        type="direct_message",
+                        user=username,
+                        to=request.to,
+                        content=request.content,
+                        view_once=bool(request.view_once),
+                        timestamp=datetime.now(),
+                    )
+                    manager.store_direct_message(message)
+                    broadcast = MessageBroadcast(
+                        type="direct_message",
+                        user=username,
+                        to=request.to,
+                        content=request.content,
+                        view_once=message.view_once,
+                        message_id=message.id,
+                        timestamp=message.timestamp
+                    )
+                    delivered = await manager.send_to_user(request.to, broadcast)
+                    # Echo to the sender's own devices so they stay in sync
+                    if request.to != username:
+                        await manager.send_to_user(username, broadcast.model_copy(update={"delivered": delivered}))
+                elif data["type"] == "typing":
+                    request = TypingRequest(**data)
+                    if request.to not in fake_users_db:
+                        await websocket.send_json({"type": "error", "detail": "Unknown recipient", "to": request.to})
+                        continue
+                    await manager.send_to_user(request.to, MessageBroadcast(
+                        type="typing",
+                        user=username,
+                        to=request.to,
+                        is_typing=request.is_typing
+                    ))
+                elif data["type"] == "read_receipt":
+                    request = ReadReceiptRequest(**data)
+                    if request.to not in fake_users_db:
+                        await websocket.send_json({"type": "error", "detail": "Unknown recipient", "to": request.to})
+                        continue
+                    # Only acknowledge messages the peer actually sent to this user
+                    if manager.verify_read_receipt(username, request.to, request.message_id):
+                        await manager.send_to_user(request.to, MessageBroadcast(
+                            type="read_receipt",
+                            user=username,
+                            to=request.to,
+                            message_id=request.message_id,
+                            timestamp=datetime.now()
+                        ))
             except ValidationError as e:
                 print(f"Validation error: {e}")
                         
@@ -11,8 +11,9 @@ class ReactionData(BaseModel):
 class Message(BaseModel):
     """Base message model with reactions support"""
     id: str
-    type: Literal["message", "join", "leave", "reaction", "add_reaction", "remove_reaction"]
+    type: Literal["message", "join", "leave", "reaction", "add_reaction", "remove_reaction", "direct_message"]
     user: str
+    to: Optional[str] = None  # Recipient for direct messages
     content: Optional[str] = None
     view_once: bool = False
     timestamp: datetime
@@ -22,8 +23,10 @@ class Message(BaseModel):
 
 class MessageBroadcast(BaseModel):
     """Model for messages sent to WebSocket clients"""
-    type: Literal["message", "join", "leave", "reaction", "reaction_update", "add_reaction", "remove_reaction"]
+    type: Literal["message", "join", "leave", "reaction", "reaction_update", "add_reaction", "remove_reaction",
+                  "direct_message", "typing", "read_receipt"]
     user: str
+    to: Optional[str] = None  # Recipient for direct messages, typing and read receipts
     content: Optional[str] = None
     view_once: Optional[bool] = None
     message_id: Optional[str] = None  # For reaction updates
@@ -31,6 +34,8 @@ class MessageBroadcast(BaseModel):
     emoji: Optional[str] = None  # For reaction updates
     users: Optional[List[str]] = None  # For reaction updates
     online: Optional[List[str]] = None
+    is_typing: Optional[bool] = None  # For typing events
+    delivered: Optional[bool] = None  # For direct message echoes to the sender
     timestamp: Optional[datetime] = None
 
 
@@ -61,3 +66,25 @@ class MessageRequest(BaseModel):
     type: Literal["message"]
     content: str
     view_once: Optional[bool] = False
+
+
+class DirectMessageRequest(BaseModel):
+    """Model for incoming direct_message requests"""
+    type: Literal["direct_message"]
+    to: str
+    content: str
+    view_once: Optional[bool] = False
+
+
+class TypingRequest(BaseModel):
+    """Model for incoming typing requests"""
+    type: Literal["typing"]
+    to: str
+    is_typing: bool = True
+
+
+class ReadReceiptRequest(BaseModel):
+    """Model for incoming read_receipt requests"""
+    type: Literal["read_receipt"]
+    to: str
+    message_id: str
@@ -0,0 +1,145 @@
+"""
+Tests for direct message delivery in ConnectionManager and the /dm/{peer} endpoint.
+Uses fake websockets so no running server is needed.
+"""
+
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from starlette.requests import Request
+
+from app import main
+from app.auth import create_access_token, fake_users_db
+from app.main import ConnectionManager
+from app.schemas import Message
+
+
+class FakeWebSocket:
+    """Minimal stand-in for a Starlette WebSocket that records sent frames"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.fail:
+            raise RuntimeError("socket closed")
+        self.sent.append(json.loads(text))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def direct_message(sender, recipient, content, timestamp, message_id):
+    return Message(id=message_id, type="direct_message", user=sender, to=recipient,
+                   content=content, timestamp=timestamp)
+
+
+@pytest.fixture
+def manager():
+    return ConnectionManager()
+
+
+def test_send_to_user_reaches_every_device_only(manager):
+    alice_phone, alice_laptop, bob = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    run(manager.connect("room1", "alice", alice_phone))
+    run(manager.connect("room2", "alice", alice_laptop))
+    run(manager.connect("room1", "bob", bob))
+    bob.sent.clear()
+
+    assert run(manager.send_to_user("alice", {"type": "typing", "user": "bob", "to": "alice"}))
+
+    assert alice_phone.sent[-1]["type"] == "typing"
+    assert alice_laptop.sent[-1]["type"] == "typing"
+    assert bob.sent == []
+
+
+def test_send_to_user_without_connections_returns_false(manager):
+    assert run(manager.send_to_user("nobody", {"type": "typing"})) is False
+
+
+def test_failed_socket_is_removed_everywhere(manager):
+    good, bad = FakeWebSocket(), FakeWebSocket()
+    run(manager.connect("room1", "alice", good))
+    run(manager.connect("room1", "alice", bad))
+    bad.fail = True
+
+    assert run(manager.send_to_user("alice", {"type": "typing"}))
+
+    assert set(manager.user_connections["alice"]) == {id(good)}
+    assert manager.rooms["room1"] == [good]
+    assert id(bad) not in manager.users["room1"]
+
+
+def test_disconnect_drops_index_entry_on_last_socket(manager):
+    first, second = FakeWebSocket(), FakeWebSocket()
+    run(manager.connect("room1", "alice", first))
+    run(manager.connect("room2", "alice", second))
+
+    run(manager.disconnect("room1", first))
+    assert set(manager.user_connections["alice"]) == {id(second)}
+
+    run(manager.disconnect("room2", second))
+    assert "alice" not in manager.user_connections
+
+
+def test_conversation_key_and_history_order(manager):
+    assert manager.conversation_key("alice", "bob") == manager.conversation_key("bob", "alice")
+
+    now = datetime.now()
+    manager.store_direct_message(direct_message("alice", "bob", "hi", now, "m1"))
+    manager.store_direct_message(direct_message("bob", "alice", "hey", now + timedelta(seconds=1), "m2"))
+
+    history = manager.get_direct_history("bob", "alice")
+    assert [message.id for message in history] == ["m1", "m2"]
+
+
+def test_read_receipt_requires_message_from_peer_to_reader(manager):
+    manager.store_direct_message(direct_message("alice", "bob", "hi", datetime.now(), "m1"))
+
+    assert manager.verify_read_receipt("bob", "alice", "m1")
+    # The sender cannot acknowledge their own message
+    assert not manager.verify_read_receipt("alice", "bob", "m1")
+    # Unknown message or a third user
+    assert not manager.verify_read_receipt("bob", "alice", "missing")
+    assert not manager.verify_read_receipt("carol", "alice", "m1")
+
+
+def make_request(peer, token=None):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return Request({"type": "http", "method": "GET", "path": f"/dm/{peer}", "headers": headers})
+
+
+@pytest.fixture
+def registered_users(manager, monkeypatch):
+    monkeypatch.setattr(main, "manager", manager)
+    for username in ("alice", "bob", "carol"):
+        monkeypatch.setitem(fake_users_db, username, {"username": username, "hashed_password": ""})
+
+
+def test_dm_history_requires_token(registered_users):
+    response = run(main.direct_history(make_request("bob"), "bob"))
+    assert response.status_code == 401
+
+
+def test_dm_history_returns_only_callers_conversation(manager, registered_users):
+    now = datetime.now()
+    manager.store_direct_message(direct_message("alice", "bob", "for bob", now, "m1"))
+    manager.store_direct_message(direct_message("carol", "bob", "not for alice", now, "m2"))
+
+    token = create_access_token({"sub": "alice"})
+    result = run(main.direct_history(make_request("bob", token), "bob"))
+
+    assert [message["id"] for message in result["messages"]] == ["m1"]
+
+
+def test_dm_history_rejects_unknown_peer(registered_users):
+    token = create_access_token({"sub": "alice"})
+    response = run(main.direct_history(make_request("ghost", token), "ghost"))
+    assert response.status_code == 404